@@ -0,0 +1,439 @@
+import argparse
+import gzip
+import http.server
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amazon_scraper_pro import (AdvancedAmazonScraper, HostRateController, JobQueue, PageArchive, ProductExtractor,
+                                StreamingProductParser, parse_field_list, reextract_archive)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    fixtures = {}
+    for name in sorted(os.listdir(fixtures_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(fixtures_dir, name), 'r', encoding='utf-8') as f:
+                fixtures[name[:-5]] = f.read()
+    return fixtures
+
+
+def padding_html(size, seed=0):
+    # Review and recommendation widget markup like the tail of a real product
+    # page, which the extractor has to scan past but never uses
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size:
+        kind = rng.randrange(3)
+        if kind == 0:
+            part = ('<div class="a-section review"><span class="a-size-base review-text">'
+                    + 'Works as described, would buy again. ' * rng.randint(5, 40) + '</span></div>\n')
+        elif kind == 1:
+            part = ('<div class="a-carousel-card"><a class="a-link-normal" href="/dp/B0%08d/ref=sspa">'
+                    '<img src="https://m.media-amazon.com/images/I/x.jpg"/></a>'
+                    '<span class="a-color-secondary">Sponsored</span></div>\n' % rng.randrange(10 ** 8))
+        else:
+            part = '<script>P.when("A").execute(function(A){var d=%s;});</script>\n' % ('"' + 'x' * rng.randint(50, 800) + '"')
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def pad_page(html, size, seed=0):
+    cut = html.rfind('</body>')
+    if cut < 0:
+        cut = len(html)
+    return html[:cut] + padding_html(size, seed) + html[cut:]
+
+
+def build_corpus(pad_kb, huge_mb):
+    corpus = {}
+    for index, (name, html) in enumerate(load_fixtures().items()):
+        corpus[name] = pad_page(html, pad_kb * 1024, seed=index)
+    # Adversarial: a multi-megabyte page whose anchors are all missing
+    corpus['huge_missing_anchors'] = pad_page(load_fixtures()['product_missing_anchors'], huge_mb * 1024 * 1024, seed=99)
+    return corpus
+
+
+def run_parse_benchmark(args):
+    extractor = ProductExtractor()
+    corpus = build_corpus(args.pad_kb, args.huge_mb)
+
+    print(f"Parse benchmark: {len(corpus)} pages, {args.repeat} repeats, fields {','.join(args.fields) if args.fields else 'all'}")
+    print(f"{'page':<24} {'size':>9} {'pages/s':>9} {'ms/page':>9} {'peak MB':>8}  slowest stages")
+    total_pages = 0
+    total_time = 0.0
+    all_timings = {}
+    for name, html in corpus.items():
+        timings = {}
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            extractor.extract(html, fields=args.fields, timings=timings)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        extractor.extract(html, fields=args.fields)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        for stage, seconds in timings.items():
+            all_timings[stage] = all_timings.get(stage, 0) + seconds
+        total_pages += args.repeat
+        total_time += elapsed
+        slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:3]
+        stages = ', '.join(f"{stage} {seconds * 1000 / args.repeat:.2f}ms" for stage, seconds in slowest)
+        print(f"{name:<24} {len(html) / 1024:>7.0f}KB {args.repeat / elapsed:>9.1f} "
+              f"{elapsed * 1000 / args.repeat:>9.2f} {peak / 1024 / 1024:>8.1f}  {stages}")
+
+    print(f"\nOverall: {total_pages / total_time:.1f} pages/s")
+    print("Per-field time (ms/page):")
+    for stage, seconds in sorted(all_timings.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {stage:<14} {seconds * 1000 / total_pages:8.3f}")
+
+
+class FixtureServer:
+    # Local stand-in for the product site. Serves /dp/<ASIN> from the fixture
+    # corpus with optional per-request latency, random 503s and gzip.
+    def __init__(self, pages, latency=0.0, error_rate=0.0, use_gzip=False, port=0):
+        self.pages = list(pages.values())
+        self.latency = latency
+        self.error_rate = error_rate
+        self.use_gzip = use_gzip
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._encoded = {}
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        # Streaming clients hang up mid-body on purpose; don't print tracebacks
+        self.httpd.handle_error = lambda request, client_address: None
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def _body(self, index, use_gzip):
+        key = (index, use_gzip)
+        if key not in self._encoded:
+            body = self.pages[index].encode('utf-8')
+            self._encoded[key] = gzip.compress(body, 6) if use_gzip else body
+        return self._encoded[key]
+
+    def _handle(self, handler):
+        with self._lock:
+            self.requests += 1
+            self.connections.add(handler.client_address)
+        if self.latency:
+            time.sleep(self.latency)
+
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            body = b'Service Unavailable'
+            handler.send_response(503)
+            handler.send_header('Retry-After', '1')
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+            return
+
+        index = sum(handler.path.encode()) % len(self.pages)
+        use_gzip = self.use_gzip and 'gzip' in handler.headers.get('Accept-Encoding', '')
+        body = self._body(index, use_gzip)
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        if use_gzip:
+            handler.send_header('Content-Encoding', 'gzip')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+        with self._lock:
+            self.bytes_sent += len(body)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run_fetch_benchmark(args):
+    corpus = build_corpus(args.pad_kb, 1)
+    corpus.pop('huge_missing_anchors')
+    server = FixtureServer(corpus, args.latency, args.error_rate, args.gzip).start()
+
+    # Retries are counted on the server side, so drop the scraper's own status lines
+    scraper = AdvancedAmazonScraper(log=lambda level, message, **fields: None)
+    scraper.max_workers = args.workers
+    scraper.parse_workers = args.parse_workers
+    scraper.streaming = args.stream
+    scraper.delay_between_requests = args.retry_delay
+    scraper.throttle = HostRateController(max_per_host=args.per_host, initial_rate=args.rate,
+                                          max_rate=max(args.rate, args.max_rate))
+    urls = [server.url(f"/dp/B{index:09d}") for index in range(args.urls)]
+
+    try:
+        start = time.perf_counter()
+        ok = failed = 0
+        for _, _, product in scraper.scrape_many(urls, fields=args.fields):
+            if product:
+                ok += 1
+            else:
+                failed += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    print(f"Fetch benchmark: {args.urls} URLs, {args.workers} workers, {args.parse_workers} parser processes, {args.per_host} per host, "
+          f"latency {args.latency * 1000:.0f}ms, 503 rate {args.error_rate:.0%}, gzip {'on' if args.gzip else 'off'}")
+    print(f"  wall time      {elapsed:.2f}s")
+    print(f"  throughput     {args.urls / elapsed:.1f} pages/s")
+    print(f"  ok / failed    {ok} / {failed}")
+    print(f"  requests       {server.requests} ({server.errors} x 503, {server.requests - args.urls} beyond one per URL)")
+    print(f"  connections    {len(server.connections)}")
+    print(f"  bytes sent     {server.bytes_sent / 1024 / 1024:.1f} MB")
+    print(f"  bytes read     {scraper.metrics.bytes_received / 1024 / 1024:.1f} MB "
+          f"({scraper.metrics.stopped_early} downloads stopped early)")
+
+
+def run_reextract_benchmark(args):
+    corpus = build_corpus(args.pad_kb, 1)
+    corpus.pop('huge_missing_anchors')
+    bodies = [(html.encode('utf-8'), 'text/html; charset=utf-8') for html in corpus.values()]
+    directory = tempfile.mkdtemp(prefix='bench-archive-')
+    try:
+        archive = PageArchive(directory, segment_bytes=args.segment_mb * 1024 * 1024)
+        raw_bytes = 0
+        start = time.perf_counter()
+        for index in range(args.pages):
+            body, content_type = bodies[index % len(bodies)]
+            archive.append(f"https://www.amazon.com/dp/B{index:09d}", body, content_type)
+            raw_bytes += len(body)
+        write_elapsed = time.perf_counter() - start
+        segments = archive.segments()
+        archive_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in segments)
+
+        start = time.perf_counter()
+        ok = failed = 0
+        for _, product, _ in reextract_archive(archive, args.parse_workers, args.fields):
+            if product is not None:
+                ok += 1
+            else:
+                failed += 1
+        elapsed = time.perf_counter() - start
+        archive.close()
+    finally:
+        shutil.rmtree(directory)
+
+    workers = args.parse_workers if args.parse_workers is not None else os.cpu_count()
+    print(f"Reextract benchmark: {args.pages} pages, {workers} parser processes, fields {','.join(args.fields) if args.fields else 'all'}")
+    print(f"  archive write  {write_elapsed:.2f}s ({raw_bytes / 1024 / 1024 / write_elapsed:.1f} MB/s)")
+    print(f"  archive size   {archive_bytes / 1024 / 1024:.1f} MB for {raw_bytes / 1024 / 1024:.1f} MB of pages "
+          f"in {len(segments)} segments")
+    print(f"  re-extract     {elapsed:.2f}s, {args.pages / elapsed:.1f} pages/s, {raw_bytes / 1024 / 1024 / elapsed:.1f} MB/s")
+    print(f"  ok / failed    {ok} / {failed}")
+
+
+def json_ld_block(rng):
+    data = {
+        '@type': 'Product',
+        'name': f"LD title {rng.randrange(1000)}",
+        'brand': {'name': f"LD brand {rng.randrange(1000)}"},
+        'offers': {'price': f"{rng.randrange(1, 1000)}.99", 'priceCurrency': rng.choice(['USD', 'EUR', 'GBP'])},
+        'aggregateRating': {'ratingValue': str(rng.randrange(1, 6)), 'reviewCount': str(rng.randrange(10000))},
+    }
+    return f'<script type="application/ld+json">{json.dumps(data)}</script>\n'
+
+
+def stream_check_page(html, layout, rng, seed):
+    # A fixture with JSON-LD blocks placed where a prefix of the page sees
+    # different values than the whole page
+    cut = html.rfind('</body>')
+    if cut < 0:
+        cut = len(html)
+    pad = padding_html(rng.randrange(1000, 200000), seed=seed)
+    if layout == 'json_ld_after_html':
+        return html[:cut] + pad + json_ld_block(rng) + html[cut:]
+    if layout == 'two_json_ld_blocks':
+        middle = rng.randrange(len(html))
+        return (html[:middle] + json_ld_block(rng) + pad + json_ld_block(rng)
+                + padding_html(rng.randrange(1000, 100000), seed=seed + 1) + html[middle:])
+    if layout == 'json_ld_first':
+        return json_ld_block(rng) + html[:cut] + pad + html[cut:]
+    return html[:cut] + pad + html[cut:]
+
+
+def run_stream_check(args):
+    # Streaming with early termination must give the same fields as a
+    # buffered parse of the whole page; exits non-zero on any difference
+    extractor = ProductExtractor(log=lambda level, message, **fields: None)
+    fixtures = list(load_fixtures().values())
+    layouts = ('json_ld_after_html', 'two_json_ld_blocks', 'json_ld_first', 'html_only')
+    field_sets = [None, ('price',), ('price', 'rating'), ('title', 'reviews'), ('brand',), ('availability',),
+                  ('availability', 'description', 'features')]
+    if args.fields:
+        field_sets = [args.fields]
+    rng = random.Random(args.seed)
+    mismatches = {}
+    stopped_early = 0
+    for index in range(args.pages):
+        layout = layouts[index % len(layouts)]
+        page = stream_check_page(rng.choice(fixtures), layout, rng, seed=index)
+        fields = rng.choice(field_sets)
+        expected = extractor.extract(page, fields=fields)
+
+        encoding = rng.choice([None, 'gzip'])
+        body = page.encode('utf-8')
+        data = gzip.compress(body) if encoding else body
+        parser = StreamingProductParser(extractor, fields=fields, first_check=rng.choice([1024, 16384, 65536]))
+        parser.start('text/html; charset=utf-8', encoding)
+        step = rng.choice([512, 4096, 16384])
+        for offset in range(0, len(data), step):
+            if parser.feed(data[offset:offset + step]):
+                stopped_early += 1
+                break
+        parser.finish()
+
+        names = [field for field in fields or extractor.FIELDS if field in extractor.FIELDS]
+        if 'price' in names:
+            names.append('currency')
+        differing = [field for field in names if parser.product.get(field) != expected.get(field)]
+        if differing:
+            mismatches[layout] = mismatches.get(layout, 0) + 1
+            if sum(mismatches.values()) <= 5:
+                print(f"  page {index} ({layout}, fields {','.join(fields) if fields else 'all'}): "
+                      + ', '.join(f"{field} {parser.product.get(field)!r} != {expected.get(field)!r}" for field in differing))
+
+    print(f"Stream check: {args.pages} pages, {stopped_early} downloads stopped early")
+    for layout in layouts:
+        print(f"  {layout:<20} {mismatches.get(layout, 0)} mismatches")
+    return 1 if mismatches else 0
+
+
+def run_queue_check(args):
+    # A worker whose leases expired and were handed to another worker must
+    # not be able to complete or fail those jobs; exits non-zero if it can
+    directory = tempfile.mkdtemp(prefix='bench-queue-')
+    path = os.path.join(directory, 'jobs.db')
+    problems = []
+    try:
+        stale = JobQueue(path, lease_seconds=0.1, owner='stale-worker')
+        current = JobQueue(path, lease_seconds=300, owner='current-worker')
+        stale.add(f"https://www.amazon.com/dp/B{index:09d}" for index in range(args.jobs))
+
+        stale_ids = [job_id for job_id, _ in stale.lease(args.jobs)]
+        time.sleep(0.2)
+        current_ids = [job_id for job_id, _ in current.lease(args.jobs)]
+        if sorted(current_ids) != sorted(stale_ids):
+            problems.append(f"expired leases were not handed over ({len(current_ids)} of {len(stale_ids)})")
+
+        half = len(stale_ids) // 2
+        completed = stale.complete(stale_ids[:half])
+        failed = stale.fail([(job_id, "stale failure") for job_id in stale_ids[half:]])
+        if completed or failed:
+            problems.append(f"stale worker acknowledged {completed} completions and {failed} failures")
+        counts = current.counts()
+        if counts['leased'] != len(current_ids):
+            problems.append(f"{len(current_ids) - counts['leased']} jobs were taken from the current worker")
+
+        acknowledged = current.complete(current_ids)
+        if acknowledged != len(current_ids):
+            problems.append(f"current worker acknowledged {acknowledged} of {len(current_ids)} jobs")
+        counts = current.counts()
+        stale.close()
+        current.close()
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"Queue check: {args.jobs} jobs, stale worker acknowledged {completed + failed} of {len(stale_ids)}")
+    print(f"  final counts   {', '.join(f'{state} {count}' for state, count in counts.items())}")
+    for problem in problems:
+        print(f"  FAILED: {problem}")
+    return 1 if problems else 0
+
+
+def run_serve(args):
+    corpus = build_corpus(args.pad_kb, args.huge_mb)
+    server = FixtureServer(corpus, args.latency, args.error_rate, args.gzip, port=args.port).start()
+    print(f"Serving {len(corpus)} fixture pages at {server.url('/dp/<ASIN>')} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Amazon Product Scraper Pro")
+    parser.add_argument('--pad-kb', type=int, default=1500, help="Pad each fixture to about this size with widget markup (default: 1500)")
+    parser.add_argument('--huge-mb', type=int, default=8, help="Size of the adversarial huge page (default: 8)")
+    parser.add_argument('--fields', type=parse_field_list, help="Comma-separated fields to extract (default: all)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parse = subparsers.add_parser('parse', help="Time extract_product_info per page and per field")
+    parse.add_argument('--repeat', type=int, default=20, help="Parses per page (default: 20)")
+
+    server_options = argparse.ArgumentParser(add_help=False)
+    server_options.add_argument('--latency', type=float, default=0.05, help="Server latency per request in seconds (default: 0.05)")
+    server_options.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503 (default: 0)")
+    server_options.add_argument('--gzip', action='store_true', help="Serve gzip-compressed bodies")
+
+    fetch = subparsers.add_parser('fetch', parents=[server_options], help="Scrape the fixture server and report throughput")
+    fetch.add_argument('--urls', type=int, default=200, help="Number of distinct product URLs (default: 200)")
+    fetch.add_argument('--workers', type=int, default=8, help="Fetch workers (default: 8)")
+    fetch.add_argument('--parse-workers', type=int, default=0, help="Parser processes; 0 parses in the fetch threads (default: 0)")
+    fetch.add_argument('--stream', action='store_true', help="Use the streaming parser with early termination")
+    fetch.add_argument('--per-host', type=int, default=8, help="Max concurrent requests to the server (default: 8)")
+    fetch.add_argument('--rate', type=float, default=1000.0, help="Initial requests per second to the server (default: 1000)")
+    fetch.add_argument('--max-rate', type=float, default=1000.0, help="Upper bound for the adaptive rate (default: 1000)")
+    fetch.add_argument('--retry-delay', type=float, default=0.1, help="Scraper retry backoff base in seconds (default: 0.1)")
+
+    reextract = subparsers.add_parser('reextract', help="Archive the fixture pages and time re-extraction from the archive")
+    reextract.add_argument('--pages', type=int, default=200, help="Pages to archive (default: 200)")
+    reextract.add_argument('--parse-workers', type=int, help="Parser processes (default: one per CPU)")
+    reextract.add_argument('--segment-mb', type=int, default=64, help="Archive segment size in MB (default: 64)")
+
+    stream_check = subparsers.add_parser('stream-check', help="Check that streaming parses match buffered parses")
+    stream_check.add_argument('--pages', type=int, default=1000, help="Generated pages to check (default: 1000)")
+    stream_check.add_argument('--seed', type=int, default=1, help="Random seed for page layouts and chunking (default: 1)")
+
+    queue_check = subparsers.add_parser('queue-check', help="Check that a worker with expired leases cannot acknowledge them")
+    queue_check.add_argument('--jobs', type=int, default=20, help="Jobs to enqueue (default: 20)")
+
+    serve = subparsers.add_parser('serve', parents=[server_options], help="Only run the fixture server")
+    serve.add_argument('--port', type=int, default=8000, help="Port to listen on (default: 8000)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    sys.exit({'parse': run_parse_benchmark, 'fetch': run_fetch_benchmark, 'reextract': run_reextract_benchmark,
+              'stream-check': run_stream_check, 'queue-check': run_queue_check, 'serve': run_serve}[args.command](args))